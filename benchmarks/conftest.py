@@ -0,0 +1,59 @@
+"""Benchmark suite of the REPL execution pipeline
+
+Requires pytest-benchmark (``pip install sphinxcontrib-repl[bench]``). Run from
+the repository root and save the results (in ``.benchmarks``) to compare them
+between releases:
+
+.. code-block::
+
+   pytest benchmarks --benchmark-autosave
+   pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+
+The size of the synthetic Sphinx project is set by the ``REPL_BENCH_DOCS``
+environment variable (default: 200 documents).
+"""
+
+import types
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from sphinxcontrib import repl
+
+
+@pytest.fixture(params=["prompt", "framed"])
+def protocol(request):
+    return request.param
+
+
+@pytest.fixture
+def start(protocol):
+    """function to start a REPL process of the protocol (killed at teardown)"""
+
+    procs = []
+
+    def start():
+        proc = (repl.REPLagent if protocol == "framed" else repl.REPLopen)()
+        procs.append(proc)
+        return proc
+
+    yield start
+
+    for proc in procs:
+        proc.kill()
+
+
+@pytest.fixture
+def proc(start):
+    return start()
+
+
+@pytest.fixture
+def fake_app(tmp_path):
+    """minimal stand-in of the Sphinx application for init_mpl()"""
+    return types.SimpleNamespace(
+        builder=types.SimpleNamespace(
+            outdir=str(tmp_path), supported_image_types=["image/svg+xml"]
+        )
+    )
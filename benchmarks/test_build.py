@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+pytest.importorskip("sphinx")
+
+from sphinx.application import Sphinx
+
+NDOCS = int(os.environ.get("REPL_BENCH_DOCS", "200"))
+
+DOC = """\
+Document {i}
+============
+
+.. repl-quiet::
+
+   import math
+   values = [math.sin(x / 10) for x in range({i} + 100)]
+
+.. repl::
+
+   len(values)
+   for v in values[:5]:
+       round(v, 3)
+
+   sum(values) / len(values)
+"""
+
+
+@pytest.fixture(scope="module")
+def srcdir(tmp_path_factory):
+    """synthetic Sphinx project with NDOCS documents"""
+
+    srcdir = tmp_path_factory.mktemp("project")
+    (srcdir / "conf.py").write_text(
+        'extensions = ["sphinxcontrib.repl"]\nrepl_mpl_disable = True\n'
+    )
+    names = [f"doc{i:04d}" for i in range(NDOCS)]
+    (srcdir / "index.rst").write_text(
+        "Benchmark\n=========\n\n.. toctree::\n\n"
+        + "".join(f"   {name}\n" for name in names)
+    )
+    for i, name in enumerate(names):
+        (srcdir / f"{name}.rst").write_text(DOC.format(i=i))
+    return srcdir
+
+
+def build(srcdir, outdir, parallel, **confoverrides):
+    app = Sphinx(
+        str(srcdir),
+        str(srcdir),
+        str(outdir),
+        str(outdir / ".doctrees"),
+        "html",
+        confoverrides=confoverrides,
+        status=None,
+        warning=None,
+        freshenv=True,
+        parallel=parallel,
+    )
+    app.build()
+
+
+@pytest.mark.parametrize("parallel", [1, 4], ids=["serial", "j4"])
+def test_build(benchmark, srcdir, tmp_path, parallel):
+    benchmark.extra_info["documents"] = NDOCS
+    benchmark.pedantic(
+        build,
+        args=(srcdir, tmp_path / "out", parallel),
+        kwargs={"repl_cache": False},
+        rounds=1,
+    )
+
+
+def test_rebuild_cached(benchmark, srcdir, tmp_path):
+    """re-read all documents with the execution cache populated"""
+
+    outdir = tmp_path / "out"
+    build(srcdir, outdir, 1)
+
+    benchmark.extra_info["documents"] = NDOCS
+    benchmark.pedantic(build, args=(srcdir, outdir, 1), rounds=1)
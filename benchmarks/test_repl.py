@@ -0,0 +1,116 @@
+import os
+import subprocess as sp
+import sys
+
+import pytest
+
+from sphinxcontrib import repl
+
+
+def test_startup(benchmark, start):
+    benchmark(start)
+
+
+def test_fork(benchmark):
+    if not hasattr(os, "fork"):
+        pytest.skip("fork not supported")
+
+    zygote = repl.REPLagent()
+    procs = []
+    try:
+        benchmark(lambda: procs.append(zygote.fork()))
+    finally:
+        for proc in procs:
+            proc.kill()
+        zygote.kill()
+
+
+def test_init_mpl(benchmark, start, fake_app):
+    pytest.importorskip("matplotlib")
+    benchmark.pedantic(
+        repl.init_mpl,
+        setup=lambda: ((start(), fake_app, None), {}),
+        rounds=10,
+    )
+
+
+def test_line(benchmark, proc):
+    benchmark(proc.communicate, ["x = 1"])
+
+
+@pytest.mark.parametrize("nlines", [20, 200])
+def test_block(benchmark, proc, nlines):
+    lines = [f"x{i} = {i}" for i in range(nlines)]
+    benchmark(proc.communicate, lines)
+
+
+def test_compound_block(benchmark, proc):
+    lines = ["for i in range(3):", *(f"    y{i} = i" for i in range(50))]
+    benchmark(proc.communicate, lines)
+
+
+def _print_command(mbytes):
+    # 100-character lines (incl. the new line)
+    return f"print(('x' * 99 + '\\n') * {int(mbytes * 1e6) // 100}, end='')"
+
+
+@pytest.mark.parametrize("mbytes", [1, 8])
+def test_large_output(benchmark, proc, mbytes):
+    benchmark.extra_info["MB"] = mbytes
+    benchmark(proc.communicate, [_print_command(mbytes)])
+
+
+@pytest.mark.parametrize("mbytes", [1, 8])
+def test_large_output_legacy(benchmark, mbytes):
+    """reference: reading 4 bytes at a time off a text pipe as in version 0.4"""
+
+    proc = sp.Popen(
+        [sys.executable, "-i", "-q"],
+        stdin=sp.PIPE,
+        stdout=sp.PIPE,
+        stderr=sp.STDOUT,
+        universal_newlines=True,
+        bufsize=0,
+    )
+    proc.stdout.read(4)
+
+    def communicate(line):
+        out_lines = []
+
+        def try_read_prompt():
+            out = proc.stdout.read(4)
+            eol = out.rfind("\n") + 1
+            while eol:
+                out_lines.append(out[: eol - 1])
+                out = out[eol:] + proc.stdout.read(eol)
+                eol = out.rfind("\n") + 1
+            return out
+
+        proc.stdin.write(f"{line}\n")
+        out = try_read_prompt()
+        while out not in (">>> ", "... "):
+            out += proc.stdout.readline()
+            out_lines.append(out[:-1])
+            out = try_read_prompt()
+        return out_lines
+
+    benchmark.extra_info["MB"] = mbytes
+    try:
+        benchmark(communicate, _print_command(mbytes))
+    finally:
+        proc.kill()
+
+
+@pytest.mark.parametrize("format", ["png", "svg", "pdf"])
+def test_figure(benchmark, proc, fake_app, format):
+    pytest.importorskip("matplotlib")
+    repl.init_mpl(proc, fake_app, format)
+    proc.communicate(["from matplotlib import pyplot as plt", "import random"])
+
+    # new random data each round so every image is written
+    lines = [
+        "plt.plot([random.random() for _ in range(1000)])",
+        "plt.title('benchmark')",
+        "plt.show()",
+    ]
+    benchmark(proc.communicate, lines)
@@ -1,12 +1,27 @@
+import hashlib
 import json
+import locale
 import os
+import queue
+import selectors
+import shutil
+import signal
 import sys
 import subprocess as sp
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 
 from docutils import nodes
 from docutils.parsers.rst import Directive, directives
 from docutils.parsers.rst.directives.images import Image
 from docutils.parsers.rst.directives.tables import align
+from sphinx.util import logging
+
+from . import framing
+
+logger = logging.getLogger(__name__)
 
 __version__ = "0.4.1"
 
@@ -32,6 +47,134 @@ def _validate_json_dict(arg):
         raise TypeError("expect JSON encoded dict")
 
 
+def process_magic(magic):
+
+    try:
+        cmd, io = magic.split("-")
+        is_in = io.startswith("in")
+        is_out = io.startswith("out")
+    except:
+        cmd = magic
+        is_in = is_out = True
+
+    show = cmd == "show"  # show/hide
+    if (not show and cmd != "hide") or not (is_in or is_out):
+        raise ValueError(f"{magic} - unknown magic comment")
+
+    return show if is_in else None, show if is_out else None
+
+
+def parse_lines(lines, show_input=True, show_output=True):
+    """strip magic comments off command lines & resolve their visibility
+
+    :param lines: Python command lines (no new line at the end)
+    :type lines: list[str]
+    :param show_input: True to show input lines by default, defaults to True
+    :type show_input: bool, optional
+    :param show_output: True to show output lines by default, defaults to True
+    :type show_output: bool, optional
+    :return: (line, show_in, show_out) of the lines to be submitted and the
+             output visibility in effect after the last line
+    :rtype: tuple[list[tuple[str, bool, bool]], bool]
+    """
+
+    items = []
+    for line in lines:
+
+        # check for magic word
+        try:
+            line, magic = line.rsplit("#repl:", 1)
+            show_in, show_out = process_magic(magic)
+            if not line or line.isspace():
+                # comment line, set new display modes and done
+                if show_in is not None:
+                    show_input = show_in
+                if show_out is not None:
+                    show_output = show_out
+                continue
+
+            # how to handle current line
+            if show_in is None:
+                show_in = show_input
+            if show_out is None:
+                show_out = show_output
+
+        except:
+            show_in = show_input
+            show_out = show_output
+
+        items.append((line, show_in, show_out))
+
+    return items, show_output
+
+
+class PipeReader:
+    """chunked reader of the interpreter output
+
+    :param file: binary pipe connected to the interpreter's stdout & stderr
+    :type file: io.RawIOBase
+    :param encoding: text encoding of the interpreter output, defaults to the
+                     locale's preferred encoding
+    :type encoding: str, optional
+    :param chunk_size: maximum number of bytes to read at a time, defaults to 65536
+    :type chunk_size: int, optional
+
+    The output is read in large chunks into a byte buffer, in which the prompt
+    is looked for. Only the complete lines are decoded, once per chunk.
+    """
+
+    prompts = (b">>> ", b"... ")
+
+    def __init__(self, file, encoding=None, chunk_size=65536):
+        self.fd = file.fileno()
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.chunk_size = chunk_size
+        self.buf = bytearray()
+        try:
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.fd, selectors.EVENT_READ)
+        except (OSError, ValueError):
+            # pipes are not selectable on Windows
+            self.selector = None
+
+    def pending(self):
+        """True if more output is immediately available"""
+        return bool(self.selector and self.selector.select(0))
+
+    def read_chunk(self):
+        chunk = os.read(self.fd, self.chunk_size)
+        if not chunk:
+            raise EOFError("REPL process terminated unexpectedly")
+        self.buf += chunk
+
+    def read_until_prompt(self):
+        """read output until the interpreter waits for the next input
+
+        :return: output lines and the prompt
+        :rtype: tuple[list[str], str]
+        """
+
+        lines = []
+        while True:
+            self.read_chunk()
+
+            # decode complete lines
+            eol = self.buf.rfind(b"\n") + 1
+            if eol:
+                text = self.buf[:eol].decode(self.encoding, "replace")
+                lines.extend(text.replace("\r\n", "\n").split("\n")[:-1])
+                del self.buf[:eol]
+
+            # prompt if nothing more to come after it
+            if self.buf.endswith(self.prompts) and not self.pending():
+                prompt = self.buf[-4:].decode(self.encoding)
+                if len(self.buf) > 4:
+                    # partial last line (printed without a new line)
+                    lines.append(self.buf[:-4].decode(self.encoding, "replace"))
+                self.buf.clear()
+                return lines, prompt
+
+
 class REPLopen(sp.Popen):
     def __init__(self) -> None:
         super().__init__(
@@ -39,11 +182,11 @@ class REPLopen(sp.Popen):
             stdin=sp.PIPE,
             stdout=sp.PIPE,
             stderr=sp.STDOUT,
-            universal_newlines=True,
             bufsize=0,
             cwd=os.getcwd(),
         )
-        self.stdout.read(4)
+        self.reader = PipeReader(self.stdout)
+        self.reader.read_until_prompt()
 
     def communicate(self, lines, show_input=True, show_output=True):
         """input command lines one at a time & record interpreter I/O
@@ -73,81 +216,23 @@ class REPLopen(sp.Popen):
         out_lines = []  # doctest_block lines to output
         out = ">>> "  # last read output
 
-        def try_read_prompt(show_out):
-            """read until 4-character Python prompt string is obtained"""
-
-            # receive 4 bytes (if no output, it is either '>>> ' or '... ')
-            out = self.stdout.read(4)
-
-            # if output line is shorter than 4 bytes, split
-            eol = out.rfind("\n") + 1
-            while eol:
-                if show_out:
-                    out_lines.append(out[: eol - 1])
-                out = out[eol:] + self.stdout.read(eol)
-                eol = out.rfind("\n") + 1
-
-            return out
-
-        def process_magic(magic):
-
-            try:
-                cmd, io = magic.split("-")
-                is_in = io.startswith("in")
-                is_out = io.startswith("out")
-            except:
-                cmd = magic
-                is_in = is_out = True
-
-            show = cmd == "show"  # show/hide
-            if (not show and cmd != "hide") or not (is_in or is_out):
-                raise self.error(f"{magic} - unknown magic comment")
-
-            return show if is_in else None, show if is_out else None
+        def write(line):
+            self.stdin.write(f"{line}\n".encode(self.reader.encoding))
 
         def read_next(show_out):
             """read output lines (If any) until encounters the next prompt"""
 
-            out = try_read_prompt(show_out)
-
-            # enter the loop only if line produced an output
-            while out not in (">>> ", "... "):
-                # output line found
-                out += self.stdout.readline()  # get the rest of the line
-                if show_out or out.startswith("#repl:"):
-                    out_lines.append(out[:-1])
-
-                # read the next 4-characters
-                out = try_read_prompt(show_out)
-
+            lines, out = self.reader.read_until_prompt()
+            out_lines.extend(
+                line for line in lines if show_out or line.startswith("#repl:")
+            )
             return out
 
-        for line in lines:
-
-            # check for magic word
-            try:
-                line, magic = line.rsplit("#repl:", 1)
-                show_in, show_out = process_magic(magic)
-                if not line or line.isspace():
-                    # comment line, set new display modes and done
-                    if show_in is not None:
-                        show_input = show_in
-                    if show_out is not None:
-                        show_output = show_out
-                    continue
-
-                # how to handle current line
-                if show_in is None:
-                    show_in = show_input
-                if show_out is None:
-                    show_out = show_output
-
-            except:
-                show_in = show_input
-                show_out = show_output
+        items, show_output = parse_lines(lines, show_input, show_output)
+        for line, show_in, show_out in items:
 
             # submit a new line to REPL
-            self.stdin.write(f"{line}\n")
+            write(line)
             if show_in:
                 out_lines.append(f"{out}{line}")
 
@@ -157,7 +242,7 @@ class REPLopen(sp.Popen):
         # insert empty lines if Python prompt is not shown
         while out != ">>> ":
             # submit a new line to REPL
-            self.stdin.write(f"\n")
+            write("")
             if show_in:
                 out_lines.append(out)
 
@@ -168,43 +253,419 @@ class REPLopen(sp.Popen):
         return out_lines
 
 
-# per-document repl processes
+class AgentClient:
+    """client side of the agent protocol (see :py:mod:`sphinxcontrib.repl.agent`)
+
+    Requires ``stdin`` and ``stdout`` attributes: unbuffered binary files
+    connected to the agent.
+    """
+
+    def communicate(self, lines, show_input=True, show_output=True):
+        """input command lines & record interpreter I/O
+
+        See :py:meth:`REPLopen.communicate` for the arguments and magic comments.
+        """
+
+        items, show_output = parse_lines(lines, show_input, show_output)
+
+        framing.write_frame(self.stdin, {"lines": [line for line, *_ in items]})
+        msg = framing.read_frame(self.stdout)
+        if msg is None:
+            raise EOFError("REPL agent process terminated unexpectedly")
+
+        out_lines = []  # doctest_block lines to output
+        show_in = show_input
+        for i, (prompt, line, output) in enumerate(msg["transcript"]):
+            if i < len(items):
+                _, show_in, show_out = items[i]
+            else:
+                # empty line inserted to close a compound statement
+                show_out = show_output
+
+            if show_in:
+                out_lines.append(f"{prompt}{line}")
+
+            out_lines.extend(
+                out
+                for out in output.splitlines()
+                if show_out or out.startswith("#repl:")
+            )
+
+        return out_lines
+
+    def fork(self):
+        """fork the agent to start a new session with a copy of its state
+
+        :return: the forked session
+        :rtype: REPLfork
+        """
+
+        tmpdir = tempfile.mkdtemp(prefix="repl-")
+        try:
+            paths = [os.path.join(tmpdir, name) for name in ("in", "out")]
+            for path in paths:
+                os.mkfifo(path)
+
+            framing.write_frame(self.stdin, {"fork": paths})
+            if framing.read_frame(self.stdout) is None:
+                raise EOFError("REPL agent process terminated unexpectedly")
+
+            # open in the same order as the forked agent to avoid a deadlock
+            stdin = open(paths[0], "wb", buffering=0)
+            stdout = open(paths[1], "rb", buffering=0)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        msg = framing.read_frame(stdout)
+        if msg is None:
+            raise EOFError("forked REPL agent terminated unexpectedly")
+        return REPLfork(msg["pid"], stdin, stdout)
+
+
+class REPLagent(AgentClient, sp.Popen):
+    """REPL process running the agent module to execute a block at a time
+
+    A drop-in replacement of :py:class:`REPLopen`, which sends the whole block in
+    one message and receives its transcript in one message instead of
+    exchanging the block a line at a time.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(
+            [sys.executable, "-m", "sphinxcontrib.repl.agent"],
+            stdin=sp.PIPE,
+            stdout=sp.PIPE,
+            bufsize=0,
+            cwd=os.getcwd(),
+        )
+
+
+class REPLfork(AgentClient):
+    """REPL session forked off an agent (see :py:meth:`AgentClient.fork`)
+
+    :param pid: process id of the forked agent
+    :type pid: int
+    :param stdin: named pipe to send the requests
+    :type stdin: io.RawIOBase
+    :param stdout: named pipe to receive the responses
+    :type stdout: io.RawIOBase
+    """
+
+    def __init__(self, pid, stdin, stdout):
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except OSError:
+            pass  # already gone
+
+
+# per-session repl processes: {docpath or "session:<name>": proc}
 repl_procs = {}
 
+# per-session execution cache states: {docpath or "session:<name>": {"key": str, "pending": list}}
+repl_cache_states = {}
+
+# pool of warm repl processes (set at builder-inited if repl_pool_size > 0)
+repl_pool = None
+
+# agent process holding the state after repl_preamble, forked to start sessions
+repl_zygote = None
+
+# per-block timings: {(docname, lineno): {phase: seconds}}
+repl_timings = {}
+
+
+class REPLpool:
+    """pool of pre-started, pre-initialized REPL processes
+
+    :param size: number of processes to keep ready
+    :type size: int
+    :param factory: function to start and initialize a new process
+    :type factory: Callable[[], REPLopen]
+
+    The processes are started on background threads. Each process taken out of
+    the pool is replaced via :py:meth:`refill` once it is disposed.
+    """
+
+    def __init__(self, size, factory):
+        self.factory = factory
+        self.pid = os.getpid()
+        self.procs = queue.Queue()
+        self.closed = False
+        for _ in range(size):
+            self.refill()
+
+    @property
+    def usable(self):
+        # the pool is not shared with forked (parallel reader) processes
+        return self.pid == os.getpid()
+
+    def _start(self):
+        try:
+            proc = self.factory()
+        except Exception as e:
+            proc = e
+        if self.closed and not isinstance(proc, Exception):
+            # pool closed while the process was starting
+            proc.kill()
+        else:
+            self.procs.put(proc)
+
+    def refill(self):
+        """start a new process in the background"""
+        threading.Thread(target=self._start, daemon=True).start()
+
+    def get(self):
+        """take a process, waiting for one to become ready if necessary"""
+        proc = self.procs.get()
+        if isinstance(proc, Exception):
+            raise proc
+        return proc
+
+    def close(self):
+        """kill all the idle processes"""
+        self.closed = True
+        while True:
+            try:
+                proc = self.procs.get_nowait()
+            except queue.Empty:
+                break
+            if not isinstance(proc, Exception):
+                proc.kill()
+
 
 def get_imgs_dir(app):
     # output_dir: final location in the builder's directory
     return os.path.join(app.builder.outdir, "_images_repl")
 
 
+def get_cache_dir(app):
+    # execution cache lives alongside the pickled doctrees
+    return os.path.join(app.doctreedir, "repl_cache")
+
+
+def _hash(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def get_session(directive):
+    """name of the session the directive block runs in
+
+    :return: the name given by the ``:session:`` option or the
+             ``repl_sessions`` config, None for the document's own session
+    :rtype: str | None
+    """
+
+    name = directive.options.get("session", None)
+    if name is None:
+        env = directive.state_machine.document.settings.env
+        name = next(
+            (
+                name
+                for name, docnames in env.config.repl_sessions.items()
+                if env.docname in docnames
+            ),
+            None,
+        )
+    return name
+
+
+def get_session_key(directive):
+    """key of the directive's session in repl_procs and repl_cache_states
+
+    The document source path for the document's own session, or
+    "session:<name>" for a named session.
+    """
+    name = get_session(directive)
+    if name is None:
+        return directive.state_machine.document.attributes["source"]
+    return f"session:{name}"
+
+
 def get_repl(directive):
 
     doc = directive.state_machine.document
 
-    # Get the source file and if it has changed, then reset the context.
-    docpath = doc.attributes["source"]
-    proc = repl_procs.get(docpath, None)
+    # Get the session key (document source file path) and if it has changed,
+    # then reset the context.
+    key = get_session_key(directive)
+    proc = repl_procs.get(key, None)
     if proc is None:
-        proc = repl_procs[docpath] = REPLopen()
+        with timed(directive, "startup"):
+            if repl_pool is not None and repl_pool.usable:
+                proc = repl_pool.get()
+            else:
+                proc = start_repl(doc.settings.env.app)
+        repl_procs[key] = proc
+
+    return proc
 
-        # if mpl_disable is not truthy
-        env = doc.settings.env
-        config = env.config
-        if not config.repl_mpl_disable:
-            init_mpl(proc, env.app, config.repl_mpl_format)
 
+def start_repl(app):
+    """start a new REPL process and initialize it per the extension config
+
+    If ``repl_preamble`` is set, the process is forked off the zygote process,
+    which has already run the preamble, or runs the preamble itself if forking
+    is not supported.
+    """
+
+    config = app.config
+
+    zygote = get_zygote(app)
+    if zygote is not None:
+        return zygote.fork()
+
+    proc = (REPLagent if config.repl_protocol == "framed" else REPLopen)()
+    init_repl(proc, app)
     return proc
 
 
-def init_mpl(proc, app, format):
+def init_repl(proc, app):
+    """initialize a new REPL process per the extension config"""
 
-    # set directory & format
-    # config = directive.state_machine.app
-    img_dir = get_imgs_dir(app)
-    os.makedirs(img_dir, exist_ok=True)
+    config = app.config
 
-    img_prefix = os.path.join(img_dir, f"mpl-").replace(".", "-")
+    set_limits(proc, config.repl_memory_limit, config.repl_cpu_limit)
 
+    # enforce the output budget (no limit by default)
+    _ = proc.communicate(
+        [f"{_budget_module}.install()"], show_input=False, show_output=True
+    )
+    if _:
+        raise RuntimeError(f"failed to install output budget:\n\n{_}")
+
+    # if mpl_disable is not truthy
+    if not config.repl_mpl_disable:
+        init_mpl(proc, app, config.repl_mpl_format)
+
+    preamble = config.repl_preamble
+    if preamble:
+        if isinstance(preamble, str):
+            preamble = preamble.splitlines()
+        _ = proc.communicate(preamble, show_input=False, show_output=True)
+        if any(line.startswith("Traceback") for line in _):
+            logger.warning("repl_preamble raised an exception:\n\n" + "\n".join(_))
+
+
+def get_zygote(app):
+    """get the zygote process (started if needed)
+
+    :return: the zygote or None if ``repl_preamble`` is not set or forking is
+             not supported
+    :rtype: REPLagent | None
+    """
+
+    global repl_zygote
+
+    if not app.config.repl_preamble or not hasattr(os, "fork"):
+        return None
+
+    # each (parallel reader) process needs its own zygote
+    if repl_zygote is None or repl_zygote.owner != os.getpid():
+        repl_zygote = REPLagent()
+        repl_zygote.owner = os.getpid()
+        init_repl(repl_zygote, app)
+
+    return repl_zygote
+
+
+def set_limits(proc, memory_limit, cpu_limit):
+    """limit the address space (bytes) and CPU time (seconds) of a REPL process
+
+    Only supported on POSIX systems, ignored elsewhere.
+    """
+
+    if os.name != "posix":
+        return
+
+    lines = [
+        f"__import__('resource').setrlimit(__import__('resource').{name}, "
+        f"({int(limit)}, __import__('resource').getrlimit(__import__('resource').{name})[1]))"
+        for name, limit in (("RLIMIT_AS", memory_limit), ("RLIMIT_CPU", cpu_limit))
+        if limit
+    ]
+    if lines:
+        _ = proc.communicate(lines, show_input=False, show_output=True)
+        if _:
+            raise RuntimeError(f"failed to set resource limits:\n\n{_}")
+
+
+_budget_module = "__import__('importlib').import_module('sphinxcontrib.repl.budget')"
+
+
+def set_output_limits(proc, max_lines, max_bytes):
+    """start a new output budget for the next block of a REPL process
+
+    Skipped if neither the current nor the new budget has a limit.
+    """
+
+    limits = (max_lines, max_bytes)
+    if limits == getattr(proc, "output_limits", (None, None)) == (None, None):
+        return
+
+    _ = proc.communicate(
+        [f"{_budget_module}.budget.reset({max_lines!r}, {max_bytes!r})"],
+        show_input=False,
+        show_output=True,
+    )
+    if _:
+        raise RuntimeError(f"failed to set output budget:\n\n{_}")
+    proc.output_limits = limits
+
+
+class Watchdog:
+    """kill a REPL process if an interaction with it does not finish in time
+
+    :param proc: REPL process
+    :type proc: REPLopen
+
+    Use the object as a context manager factory: ``with watchdog(timeout): ...``
+    """
+
+    def __init__(self, proc):
+        self.proc = proc
+        self.timeout = None
+        self.expired = False
+
+    def _expire(self):
+        self.expired = True
+        self.proc.kill()
+
+    @contextmanager
+    def __call__(self, timeout):
+        if not timeout:
+            yield
+            return
+
+        self.timeout = timeout
+        timer = threading.Timer(timeout, self._expire)
+        timer.start()
+        try:
+            yield
+        finally:
+            timer.cancel()
+
+
+def start_pool(app):
+    """start the zygote and the pool of warm REPL processes (builder-inited event)"""
+
+    global repl_pool
+
+    get_zygote(app)
+
+    if app.config.repl_pool_size > 0:
+        repl_pool = REPLpool(app.config.repl_pool_size, lambda: start_repl(app))
+
+
+def get_mpl_format(app, format):
     if format is None:
         # auto-detect based on the builder's supported type
         supported_image_types = app.builder.supported_image_types
@@ -217,25 +678,393 @@ def init_mpl(proc, app, format):
             }.items()
             if mime in supported_image_types
         )
+    return format
+
+
+def init_mpl(proc, app, format):
+
+    # set directory & format
+    # config = directive.state_machine.app
+    img_dir = get_imgs_dir(app)
+    os.makedirs(img_dir, exist_ok=True)
+
+    format = get_mpl_format(app, format)
 
     # set directory and format on the repl process
     # - if matplotlib not installed, these lines will silently fail
     cmds = [
         "import matplotlib as _mpl",
         '_mpl.use("module://sphinxcontrib.repl.mpl_backend")',
-        f'_mpl.rcParams["savefig.directory"] = r"{img_prefix}"',
+        f'_mpl.rcParams["savefig.directory"] = r"{img_dir}"',
         f'_mpl.rcParams["savefig.format"] = "{format}"',
+        # fixed svg ids so identical figures are saved as identical files
+        '_mpl.rcParams["svg.hashsalt"] = "sphinxcontrib-repl"',
     ]
     _ = proc.communicate(cmds, show_input=False, show_output=True)
     if _:
         raise RuntimeError(f"failed to initialize matplotlib:\n\n{_}")
 
 
-def kill_repl(app, doctree):
-    key = doctree.settings._source
+def get_cache_init_key(env):
+    """cache key of a fresh REPL session
+
+    The key covers everything that affects the outputs before the first block
+    runs: the interpreter and extension versions and the matplotlib settings.
+    """
+    config = env.config
+    app = env.app
+    mpl_config = (
+        None
+        if config.repl_mpl_disable
+        else (
+            get_imgs_dir(app),
+            get_mpl_format(app, config.repl_mpl_format),
+            *(
+                config[f"repl_mpl_{name}"]
+                for name in (
+                    "figsize",
+                    "dpi",
+                    "facecolor",
+                    "edgecolor",
+                    "bbox",
+                    "pad_inches",
+                    "transparent",
+                    "rc_params",
+                )
+            ),
+        )
+    )
+    return _hash(
+        sys.executable,
+        sys.version,
+        __version__,
+        mpl_config,
+        config.repl_preamble,
+        config.repl_max_output_lines,
+        config.repl_max_output_bytes,
+    )
+
+
+def load_cache(app, key):
+    """load recorded output lines of a block
+
+    :return: recorded lines or None if not cached or any of its images is gone
+    """
+    try:
+        with open(os.path.join(get_cache_dir(app), f"{key}.json"), "rt") as f:
+            out_lines = json.load(f)["out_lines"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+    if any(
+        line.startswith("#repl:img:") and not os.path.exists(line[10:])
+        for line in out_lines
+    ):
+        return None
+
+    return out_lines
+
+
+def save_cache(app, key, out_lines):
+    cache_dir = get_cache_dir(app)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # write to a temp file first so a concurrent reader never sees a partial file
+    file = os.path.join(cache_dir, f"{key}.json")
+    tmpfile = f"{file}.{os.getpid()}"
+    with open(tmpfile, "wt") as f:
+        json.dump({"out_lines": out_lines}, f)
+    os.replace(tmpfile, file)
+
+
+def run_block(directive, show_input, show_output):
+    """run the directive content on the document's REPL (or replay it from cache)
+
+    Each block is keyed on the hash of its content and options chained with the
+    keys of all the preceding blocks of the document. As long as the document
+    blocks are found in the cache, their recorded outputs are replayed without
+    starting an interpreter. On the first miss, the REPL is started and the
+    skipped blocks are silently re-run to restore the interpreter state.
+
+    :return: list of stored interpreter lines
+    :rtype: list[str]
+    """
+
+    doc = directive.state_machine.document
+    env = doc.settings.env
+    session = get_session_key(directive)
+    lines = list(directive.content)
+
+    name = get_session(directive)
+    if name is not None:
+        note_file(env, "repl_sessions", name)
+
+    state = repl_cache_states.get(session, None)
+    if state is None:
+        state = repl_cache_states[session] = {
+            "key": get_cache_init_key(env),
+            "pending": [],
+        }
+
+    state["key"] = key = _hash(
+        state["key"],
+        directive.name,
+        lines,
+        sorted(directive.options.items()),
+    )
+    if env.config.repl_cache:
+        note_file(env, "repl_cache_keys", key)
+
+    config = env.config
+    use_cache = config.repl_cache and not state.get("failed", False)
+    if use_cache and session not in repl_procs:
+        with timed(directive, "cache"):
+            out_lines = load_cache(env.app, key)
+        if out_lines is not None:
+            repl_timings[(env.docname, directive.lineno)]["cached"] = True
+            state["pending"].append((lines, directive.options))
+            return out_lines
+
+    proc = get_repl(directive)
+    watchdog = Watchdog(proc)
+
+    try:
+        # catch up with the blocks replayed from the cache
+        for pending_lines, options in state["pending"]:
+            with watchdog(options.get("timeout", config.repl_timeout)):
+                with timed(directive, "catchup"):
+                    modify_mpl_rcparams(proc, options)
+                    set_output_limits(proc, *get_output_limits(config, options))
+                    proc.communicate(
+                        pending_lines, show_input=False, show_output=False
+                    )
+        state["pending"].clear()
+
+        with watchdog(directive.options.get("timeout", config.repl_timeout)):
+            # apply if any mpl.rcParams options are given
+            with timed(directive, "rcparams"):
+                modify_mpl_rcparams(proc, directive.options)
+
+            set_output_limits(proc, *get_output_limits(config, directive.options))
+
+            # run the content on REPL and get stdin+stdout+stderr block of lines
+            with timed(directive, "communicate"):
+                out_lines = proc.communicate(lines, show_input, show_output)
+
+    except (EOFError, OSError):
+        reason = (
+            f"timed out after {watchdog.timeout} seconds"
+            if watchdog.expired
+            else "terminated unexpectedly"
+        )
+        logger.warning(
+            f"REPL process {reason}; block skipped and interpreter restarted",
+            location=(env.docname, directive.lineno),
+        )
+
+        # the rest of the document runs on a fresh interpreter without cache
+        discard_repl(session)
+        state["pending"].clear()
+        state["failed"] = True
+        return []
+
+    if use_cache:
+        save_cache(env.app, key, out_lines)
+
+    return out_lines
+
+
+def get_output_limits(config, options):
+    """maximum numbers of output lines and bytes of a block"""
+    return (
+        options.get("max-output", config.repl_max_output_lines),
+        config.repl_max_output_bytes,
+    )
+
+
+def note_file(env, attr, name):
+    """register a file generated for (or a session used by) the current document
+
+    :param env: build environment
+    :type env: BuildEnvironment
+    :param attr: environment attribute: "repl_images", "repl_cache_keys", or
+                 "repl_sessions"
+    :type attr: str
+    :param name: file name (or cache key or session name)
+    :type name: str
+    """
+    if not hasattr(env, attr):
+        setattr(env, attr, {})
+    getattr(env, attr).setdefault(env.docname, set()).add(name)
+
+
+def purge_files(app, env, docname):
+    """forget the files and sessions of a document (env-purge-doc event)"""
+    for attr in ("repl_images", "repl_cache_keys", "repl_sessions"):
+        getattr(env, attr, {}).pop(docname, None)
+
+
+def merge_files(app, env, docnames, other):
+    """merge the files and sessions of a parallel reader (env-merge-info event)"""
+    for attr in ("repl_images", "repl_cache_keys", "repl_sessions"):
+        if hasattr(other, attr):
+            if not hasattr(env, attr):
+                setattr(env, attr, {})
+            getattr(env, attr).update(getattr(other, attr))
+
+
+def collect_garbage(app, exception):
+    """delete images and cache entries no document refers to (build-finished event)"""
+
+    if exception is not None:
+        return
+
+    env = app.env
+    for dir, attr, ext in (
+        (get_imgs_dir(app), "repl_images", ""),
+        (get_cache_dir(app), "repl_cache_keys", ".json"),
+    ):
+        if not os.path.isdir(dir):
+            continue
+        used = set().union(*getattr(env, attr, {}).values())
+        for name in os.listdir(dir):
+            if name[: len(name) - len(ext)] not in used:
+                os.remove(os.path.join(dir, name))
+
+
+@contextmanager
+def timed(directive, phase):
+    """time a processing phase of a directive block
+
+    :param directive: repl or repl-quiet directive
+    :type directive: Directive
+    :param phase: phase name: "startup", "catchup", "rcparams", "communicate",
+                  or "images"
+    :type phase: str
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        env = directive.state_machine.document.settings.env
+        timing = repl_timings.setdefault((env.docname, directive.lineno), {})
+        timing[phase] = timing.get(phase, 0.0) + time.perf_counter() - t0
+
+
+def report_timings(app, exception):
+    """log the timing summary and save it to repl_timings.json (build-finished event)"""
+
+    if exception is not None or not app.config.repl_timing_report:
+        return
+
+    blocks = sorted(
+        (
+            {
+                "docname": docname,
+                "line": lineno,
+                **timing,
+                "total": sum(v for v in timing.values() if isinstance(v, float)),
+            }
+            for (docname, lineno), timing in repl_timings.items()
+        ),
+        key=lambda block: block["total"],
+        reverse=True,
+    )
+    documents = {}
+    for block in blocks:
+        documents[block["docname"]] = documents.get(block["docname"], 0.0) + block["total"]
+    documents = dict(sorted(documents.items(), key=lambda item: item[1], reverse=True))
+    startup = sum(block.get("startup", 0.0) for block in blocks)
+
+    os.makedirs(app.outdir, exist_ok=True)
+    with open(os.path.join(app.outdir, "repl_timings.json"), "wt") as f:
+        json.dump({"startup": startup, "documents": documents, "blocks": blocks}, f, indent=2)
+
+    top = app.config.repl_timing_top
+    logger.info(
+        f"repl: {len(blocks)} blocks in {len(documents)} documents took "
+        f"{sum(documents.values()):.2f} s (interpreter startup: {startup:.2f} s)"
+    )
+    logger.info("repl: slowest blocks")
+    for block in blocks[:top]:
+        cached = " (cached)" if block.get("cached", False) else ""
+        logger.info(f"{block['total']:10.3f} s  {block['docname']}:{block['line']}{cached}")
+    logger.info("repl: slowest documents")
+    for docname, total in list(documents.items())[:top]:
+        logger.info(f"{total:10.3f} s  {docname}")
+
+
+def discard_repl(key):
+    """kill the REPL process of a document"""
     if key in repl_procs:
         repl_procs[key].kill()
         del repl_procs[key]
+        if repl_pool is not None and repl_pool.usable:
+            repl_pool.refill()
+
+
+def kill_repl(app, doctree):
+    keys = [doctree.settings._source]
+
+    # named sessions last until their last document is read
+    docname = app.env.docname
+    keys.extend(
+        f"session:{name}"
+        for name, docnames in app.config.repl_sessions.items()
+        if docnames and docnames[-1] == docname
+    )
+
+    for key in keys:
+        discard_repl(key)
+        repl_cache_states.pop(key, None)
+
+
+def get_session_docs(app, env):
+    """documents of each named session
+
+    :return: configured documents in order followed by the other documents
+             found using the session
+    :rtype: dict[str, list[str]]
+    """
+
+    sessions = {name: list(docnames) for name, docnames in app.config.repl_sessions.items()}
+    for docname, names in sorted(getattr(env, "repl_sessions", {}).items()):
+        for name in names:
+            docnames = sessions.setdefault(name, [])
+            if docname not in docnames:
+                docnames.append(docname)
+    return sessions
+
+
+def reread_sessions(app, env, added, changed, removed):
+    """re-read all documents of a named session if any of them changed
+    (env-get-outdated event)"""
+
+    outdated = added | changed | removed
+    return [
+        docname
+        for docnames in get_session_docs(app, env).values()
+        if outdated.intersection(docnames)
+        for docname in docnames
+    ]
+
+
+def order_sessions(app, env, docnames):
+    """read the documents of each named session in the session order
+    (env-before-read-docs event)"""
+
+    sessions = get_session_docs(app, env)
+    for session_docs in sessions.values():
+        indices = [i for i, docname in enumerate(docnames) if docname in session_docs]
+        ordered = sorted((docnames[i] for i in indices), key=session_docs.index)
+        for i, docname in zip(indices, ordered):
+            docnames[i] = docname
+
+    if sessions and app.parallel > 1:
+        logger.warning(
+            "repl: documents of a named session may be split among parallel "
+            "readers, each running its own session"
+        )
 
 
 def kill_all(*_):
@@ -243,9 +1072,23 @@ def kill_all(*_):
 
     This is a safeguard function. All processes should have already been terminated at this point.
     """
+    global repl_pool, repl_zygote
+
     for p in repl_procs.values():
         p.kill()
     repl_procs.clear()
+    repl_cache_states.clear()
+    repl_timings.clear()
+
+    if repl_pool is not None:
+        if repl_pool.usable:
+            repl_pool.close()
+        repl_pool = None
+
+    if repl_zygote is not None:
+        if repl_zygote.owner == os.getpid():
+            repl_zygote.kill()
+        repl_zygote = None
 
 
 def create_image_node(document, line, options):
@@ -261,6 +1104,10 @@ def create_image_node(document, line, options):
     )
     img_relpath = os.path.relpath(imgpath, rst_outdir)
     uri = directives.uri(img_relpath.replace("\\", "/"))
+
+    # keep the image from being garbage-collected
+    note_file(document.settings.env, "repl_images", os.path.basename(imgpath))
+
     return nodes.image(line, uri=uri, **image_options)
 
 
@@ -435,6 +1282,9 @@ class REPL(Directive):
     option_spec = {
         "hide-input": _option_boolean,
         "hide-output": _option_boolean,
+        "timeout": float,
+        "session": directives.unchanged_required,
+        "max-output": directives.nonnegative_int,
         **create_mpl_option_spec(),
         **create_image_option_spec(),
         **create_table_option_spec(),
@@ -442,14 +1292,9 @@ class REPL(Directive):
 
     def run(self):
 
-        proc = get_repl(self)
-
-        # apply if any mpl.rcParams options are given
-        modify_mpl_rcparams(proc, self.options)
-
         # run the content on REPL and get stdin+stdout+stderr block of lines
-        lines = proc.communicate(
-            self.content,
+        lines = run_block(
+            self,
             show_input=not self.options.get("hide-input", False),
             show_output=not self.options.get("hide-output", False),
         )
@@ -473,7 +1318,10 @@ class REPL(Directive):
         def to_node(block):
             if block[0].startswith("#repl:img:"):
                 # generated new image
-                return create_mpl_node(self.state_machine.document, block, self.options)
+                with timed(self, "images"):
+                    return create_mpl_node(
+                        self.state_machine.document, block, self.options
+                    )
             else:
                 s = "\n".join(block)
                 return nodes.doctest_block(s, s, language="python")
@@ -486,6 +1334,9 @@ class REPL_Quiet(Directive):
     required_arguments = 0
     optional_arguments = 0
     option_spec = {
+        "timeout": float,
+        "session": directives.unchanged_required,
+        "max-output": directives.nonnegative_int,
         **create_mpl_option_spec(),
         **create_image_option_spec(),
         **create_table_option_spec(),
@@ -495,16 +1346,12 @@ class REPL_Quiet(Directive):
         # dump the content on REPL & ignore what's printed on the interpreter
         # do show the matplotlib figures
 
-        proc = get_repl(self)
-
-        # apply if any mpl.rcParams options are given
-        modify_mpl_rcparams(proc, self.options)
-
         # run the content on REPL and get stdin+stdout+stderr block of lines
-        lines = proc.communicate(self.content, show_input=False, show_output=False)
+        lines = run_block(self, show_input=False, show_output=False)
 
         # only return the image lines
-        return [create_mpl_node(self.state_machine.document, lines, self.options)]
+        with timed(self, "images"):
+            return [create_mpl_node(self.state_machine.document, lines, self.options)]
 
 
 def mpl_init(app, config):
@@ -551,6 +1398,18 @@ def mpl_init(app, config):
 
 def setup(app):
 
+    app.add_config_value("repl_cache", True, "", [bool])
+    app.add_config_value("repl_pool_size", 0, "", [int])
+    app.add_config_value("repl_protocol", "prompt", "", [str])
+    app.add_config_value("repl_preamble", None, "", [str, list])
+    app.add_config_value("repl_sessions", {}, "", [dict])
+    app.add_config_value("repl_max_output_lines", None, "", [int])
+    app.add_config_value("repl_max_output_bytes", None, "", [int])
+    app.add_config_value("repl_timeout", None, "", [int, float])
+    app.add_config_value("repl_memory_limit", None, "", [int])
+    app.add_config_value("repl_cpu_limit", None, "", [int])
+    app.add_config_value("repl_timing_report", False, "", [bool])
+    app.add_config_value("repl_timing_top", 10, "", [int])
     app.add_config_value("repl_mpl_disable", False, "", [bool])
     app.add_config_value("repl_mpl_figsize", None, "", [tuple])
     app.add_config_value("repl_mpl_dpi", 96, "", [int])
@@ -566,7 +1425,14 @@ def setup(app):
     app.add_directive("repl-quiet", REPL_Quiet)
 
     app.connect("config-inited", mpl_init)
+    app.connect("builder-inited", start_pool)
     app.connect("doctree-read", kill_repl)
+    app.connect("env-get-outdated", reread_sessions)
+    app.connect("env-before-read-docs", order_sessions)
+    app.connect("env-purge-doc", purge_files)
+    app.connect("env-merge-info", merge_files)
+    app.connect("build-finished", report_timings)
+    app.connect("build-finished", collect_garbage)
     app.connect("build-finished", kill_all)
 
     return {
@@ -0,0 +1,150 @@
+"""REPL agent - run in the REPL process (``python -m sphinxcontrib.repl.agent``)
+
+Instead of scraping the prompts of ``python -i`` line by line, the agent
+receives a whole block of command lines in one message, pushes them one at a
+time to an interactive console, and returns the transcript of the block in one
+message.
+
+Messages are JSON objects, framed by their 4-byte big-endian length (see
+:py:mod:`sphinxcontrib.repl.framing`):
+
+- request: ``{"lines": [str, ...]}``
+- response: ``{"transcript": [[prompt, line, output], ...]}``
+
+The transcript has an entry per submitted line followed by the entries of the
+empty lines the agent inserted to close an open compound statement.
+
+An agent can also be forked (POSIX only) to start a new session with a copy of
+its interpreter state:
+
+- request: ``{"fork": [input_fifo_path, output_fifo_path]}``
+- response: ``{"forked": true}``
+
+The forked agent (detached from the forking agent by a double fork) opens the
+named pipes, sends ``{"pid": int}`` on the output pipe, and then serves the
+requests sent over the input pipe.
+"""
+
+import code
+import io
+import os
+import sys
+import types
+from contextlib import redirect_stderr, redirect_stdout
+
+from . import budget
+from .framing import read_frame, write_frame
+
+class ReplConsole(code.InteractiveConsole):
+    def __init__(self, locals=None):
+        super().__init__(locals, filename="<stdin>")
+
+    def push_line(self, line):
+        """push a line and capture everything it printed
+
+        :return: True if more input is required, and the captured output
+        :rtype: tuple[bool, str]
+        """
+        buf = io.StringIO()
+        out = budget.wrap(buf)
+        with redirect_stdout(out), redirect_stderr(out):
+            more = self.push(line)
+            sys.stdout.flush()
+        return more, buf.getvalue()
+
+    def run_lines(self, lines):
+        """run command lines as if they were typed in the interactive interpreter
+
+        :param lines: Python command lines (no new line at the end)
+        :type lines: list[str]
+        :return: [prompt, line, output] of each line
+        :rtype: list[list[str]]
+        """
+        ps1 = getattr(sys, "ps1", ">>> ")
+        ps2 = getattr(sys, "ps2", "... ")
+
+        transcript = []
+        more = False
+        for line in lines:
+            prompt = ps2 if more else ps1
+            more, output = self.push_line(line)
+            transcript.append([prompt, line, output])
+
+        # insert empty lines to close an open compound statement
+        while more:
+            more, output = self.push_line("")
+            transcript.append([ps2, "", output])
+
+        return transcript
+
+
+def fork(paths):
+    """fork a detached copy of the agent
+
+    :param paths: paths of the input and output named pipes of the copy
+    :type paths: list[str]
+    :return: input and output files in the copy, None in the calling agent
+    :rtype: tuple[io.RawIOBase, io.RawIOBase] | None
+    """
+
+    pid = os.fork()
+    if pid:
+        # reap the intermediate process
+        os.waitpid(pid, 0)
+        return None
+
+    if os.fork():
+        # intermediate process: exit right away to orphan the copy
+        os._exit(0)
+
+    fin = open(paths[0], "rb", buffering=0)
+    fout = open(paths[1], "wb", buffering=0)
+    write_frame(fout, {"pid": os.getpid()})
+    return fin, fout
+
+
+def serve(console, fin, fout):
+    """serve the requests until the input is closed"""
+
+    while True:
+        msg = read_frame(fin)
+        if msg is None:
+            break
+
+        if "fork" in msg:
+            files = fork(msg["fork"])
+            if files is None:
+                write_frame(fout, {"forked": True})
+            else:
+                fin.close()
+                fout.close()
+                fin, fout = files
+            continue
+
+        write_frame(fout, {"transcript": console.run_lines(msg["lines"])})
+
+
+def main():
+
+    # take over stdin/stdout for the messages so the code blocks cannot
+    # interfere with them: input() gets EOF and the low-level writes to stdout
+    # go to stderr
+    fin = os.fdopen(os.dup(0), "rb", buffering=0)
+    fout = os.fdopen(os.dup(1), "wb", buffering=0)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(2, 1)
+
+    # run the code blocks in a fresh __main__ module like the interpreter does
+    main_module = types.ModuleType("__main__")
+    sys.modules["__main__"] = main_module
+    sys.ps1 = ">>> "
+    sys.ps2 = "... "
+    console = ReplConsole(main_module.__dict__)
+
+    serve(console, fin, fout)
+
+
+if __name__ == "__main__":
+    main()
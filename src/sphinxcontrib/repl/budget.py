@@ -0,0 +1,109 @@
+"""Output budget - run in the REPL process
+
+Limits the number of lines and bytes a code block may print. Once the budget
+is used up, the rest of the block's output is dropped and replaced by a single
+elision marker line, so oversized outputs (e.g., the repr of a large array)
+never leave the REPL process.
+
+The special ``#repl:`` comment lines (e.g., image paths) are always let through.
+"""
+
+import sys
+
+ELISION = "[... output truncated ...]\n"
+
+
+class Budget:
+    """output budget of the current code block"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, max_lines=None, max_bytes=None):
+        """start a new budget
+
+        :param max_lines: maximum number of lines, defaults to None (no limit)
+        :type max_lines: int, optional
+        :param max_bytes: maximum number of bytes, defaults to None (no limit)
+        :type max_bytes: int, optional
+        """
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.nlines = 0
+        self.nbytes = 0
+        self.truncated = False
+        self.bol = True  # at the beginning of a line
+        self.special = False  # current line is a #repl: comment
+
+    @property
+    def unlimited(self):
+        return self.max_lines is None and self.max_bytes is None
+
+    def write(self, stream, s):
+        """write a string to the stream within the budget"""
+
+        if self.unlimited:
+            return stream.write(s)
+
+        for piece in s.splitlines(keepends=True):
+            if self.bol:
+                self.special = piece.startswith("#repl:")
+            eol = piece.endswith("\n")
+
+            if self.special:
+                stream.write(piece)
+            elif not self.truncated:
+                nbytes = len(piece.encode("utf-8", "replace"))
+                if self.max_bytes is not None and self.nbytes + nbytes > self.max_bytes:
+                    # keep what fits and elide the rest
+                    piece = piece[: self.max_bytes - self.nbytes]
+                    self.truncated = True
+                elif (
+                    self.bol
+                    and self.max_lines is not None
+                    and self.nlines >= self.max_lines
+                ):
+                    piece = ""
+                    self.truncated = True
+
+                self.nbytes += nbytes
+                self.nlines += eol
+                if self.truncated:
+                    if piece and not piece.endswith("\n"):
+                        piece += "\n"
+                    elif not piece and not self.bol:
+                        piece = "\n"
+                    piece += ELISION
+                stream.write(piece)
+
+            self.bol = eol
+
+        return len(s)
+
+
+budget = Budget()
+
+
+class BudgetWriter:
+    """text stream wrapper enforcing the output budget"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, s):
+        return budget.write(self.stream, s)
+
+    def __getattr__(self, name):
+        # encoding, errors, fileno, buffer, etc. of the wrapped stream
+        return getattr(self.stream, name)
+
+
+def wrap(stream):
+    """wrap a text stream to enforce the output budget"""
+    return stream if isinstance(stream, BudgetWriter) else BudgetWriter(stream)
+
+
+def install():
+    """enforce the output budget on sys.stdout and sys.stderr"""
+    sys.stdout = wrap(sys.stdout)
+    sys.stderr = wrap(sys.stderr)
@@ -0,0 +1,44 @@
+"""Length-prefixed JSON messages exchanged with the REPL agent
+
+Used on both ends of the agent protocol (see :py:mod:`sphinxcontrib.repl.agent`).
+"""
+
+import json
+import struct
+
+_header = struct.Struct(">I")
+
+
+def read_exactly(file, n):
+    """read n bytes from an unbuffered binary file
+
+    :return: the bytes or None if end of file is reached
+    """
+    data = bytearray()
+    while len(data) < n:
+        chunk = file.read(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def read_frame(file):
+    """read a message
+
+    :return: the decoded message or None if end of file is reached
+    """
+    header = read_exactly(file, _header.size)
+    if header is None:
+        return None
+    data = read_exactly(file, _header.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+
+def write_frame(file, msg):
+    """write a message"""
+    data = json.dumps(msg).encode("utf-8")
+    file.write(_header.pack(len(data)) + data)
+    file.flush()
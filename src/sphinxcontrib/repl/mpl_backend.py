@@ -1,33 +1,89 @@
+import hashlib
+import importlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from matplotlib.backend_bases import _Backend, FigureManagerBase
 from matplotlib._pylab_helpers import Gcf
-from matplotlib.backends.backend_svg import FigureCanvasSVG
 from matplotlib import rcParams
 
+# backend module of the native canvas of each format
+_canvas_backends = {"png": "agg", "pdf": "pdf", "svg": "svg", "ps": "ps", "eps": "ps"}
+
+# drop the timestamps so identical figures are saved as identical files
+_metadata = {
+    "svg": {"Date": None},
+    "pdf": {"CreationDate": None},
+    "ps": {"CreationDate": None},
+    "eps": {"CreationDate": None},
+}
+
+
+def get_canvas_class(format):
+    """canvas class native to the image format (Agg canvas for raster formats)"""
+    name = _canvas_backends.get(format, "agg")
+    return importlib.import_module(f"matplotlib.backends.backend_{name}").FigureCanvas
+
+
+def save_figure(fig, directory, format):
+    """save a figure to a file named by the hash of its content
+
+    :return: path of the image file
+    """
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format=format, metadata=_metadata.get(format, None))
+    data = buf.getvalue()
+
+    fname = os.path.join(directory, f"{hashlib.sha1(data).hexdigest()}.{format}")
+    if not os.path.exists(fname):
+        # write to a temp file first so a concurrent reader never sees a partial file
+        tmpname = f"{fname}.{os.getpid()}"
+        with open(tmpname, "wb") as f:
+            f.write(data)
+        os.replace(tmpname, fname)
+
+    return fname
+
 
 @_Backend.export
 class ReplBackend(_Backend):
-    FigureCanvas = FigureCanvasSVG
+    FigureCanvas = get_canvas_class(rcParams["savefig.format"])
     FigureManager = FigureManagerBase
 
-    fig_count = 0
+    @classmethod
+    def new_figure_manager_given_figure(cls, num, figure):
+        # pick the canvas per the format in effect when the figure is created
+        canvas_class = get_canvas_class(rcParams["savefig.format"])
+        if hasattr(canvas_class, "new_manager"):
+            return canvas_class.new_manager(figure, num)
+        return cls.FigureManager(canvas_class(figure), num)
 
     @classmethod
     def show(cls, *, block=None):
         """
         "show" all figures.
 
+        Multiple figures are saved concurrently on worker threads. The image
+        path of each figure is printed in the figure order once it is saved.
         """
 
-        prefix = rcParams["savefig.directory"]
+        directory = rcParams["savefig.directory"]
         format = rcParams["savefig.format"]
+        figures = [manager.canvas.figure for manager in Gcf.figs.values()]
 
-        for figno, fig in Gcf.figs.items():
-            fname = f"{prefix}{cls.fig_count}_{figno}.{format}"
-            fig.canvas.figure.savefig(fname, format=format)
-            # notify the repl extension
-            print(f"#repl:img:{fname}")
+        def save(fig):
+            return save_figure(fig, directory, format)
 
-        cls.fig_count += 1
+        if len(figures) > 1:
+            with ThreadPoolExecutor(min(len(figures), os.cpu_count() or 1)) as pool:
+                for fname in pool.map(save, figures):
+                    # notify the repl extension
+                    print(f"#repl:img:{fname}")
+        else:
+            for fig in figures:
+                print(f"#repl:img:{save(fig)}")
 
         # close all figures
         Gcf.destroy_all()
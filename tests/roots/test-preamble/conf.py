@@ -0,0 +1,8 @@
+extensions = ["sphinxcontrib.repl"]
+
+repl_mpl_disable = True
+repl_cache = False
+repl_preamble = """
+import os
+ANSWER = 42
+"""
@@ -0,0 +1,5 @@
+extensions = ["sphinxcontrib.repl"]
+
+repl_mpl_disable = True
+repl_cache = False
+repl_sessions = {"tutorial": ["setup", "analysis"]}
@@ -0,0 +1,4 @@
+extensions = ["sphinxcontrib.repl"]
+
+repl_mpl_disable = True
+repl_cache = False
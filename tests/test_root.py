@@ -1,4 +1,12 @@
+import json
+import os
+import shutil
+
 import pytest
+from docutils import nodes
+from sphinx.testing.path import path
+
+from sphinxcontrib import repl
 
 # see https://github.com/sphinx-doc/sphinx/issues/7008
 
@@ -23,3 +31,110 @@ def test_tabular(app):
 # def test_confoverrides(app):
 #     # a Sphinx application configured with given setting
 #     app.build()
+
+@pytest.mark.sphinx(testroot='tabular')
+def test_cache(app, make_app, monkeypatch):
+    # first build populates the execution cache
+    app.build()
+    assert os.listdir(os.path.join(app.doctreedir, 'repl_cache'))
+
+    # rebuild from scratch must replay the cache without starting any REPL
+    def fail():
+        raise AssertionError('REPL started despite cached outputs')
+
+    monkeypatch.setattr(repl, 'REPLopen', fail)
+    app2 = make_app(srcdir=app.srcdir, freshenv=True)
+    app2.build()
+
+@pytest.mark.sphinx(testroot='tabular', confoverrides={'repl_pool_size': 2, 'repl_cache': False})
+def test_pool(app):
+    app.build()
+    assert repl.repl_pool is None
+
+def test_framed_protocol(make_app, rootdir, tmp_path):
+    # the framed agent must produce the same doctest blocks as the prompt protocol
+    texts = {}
+    for protocol in ('prompt', 'framed'):
+        srcdir = tmp_path / protocol
+        shutil.copytree(rootdir / 'test-root', srcdir)
+        app = make_app(srcdir=path(str(srcdir)), confoverrides={'repl_protocol': protocol})
+        app.build()
+        doctree = app.env.get_doctree('index')
+        texts[protocol] = [node.astext() for node in doctree.findall(nodes.doctest_block)]
+    assert texts['prompt'] == texts['framed']
+
+@pytest.mark.sphinx(testroot='timeout')
+def test_timeout(app, warning):
+    app.build()
+    assert 'timed out after 1.0 seconds' in warning.getvalue()
+    doctree = app.env.get_doctree('index')
+    assert [node.astext() for node in doctree.findall(nodes.doctest_block)] == [
+        ">>> 'still running'\n'still running'"
+    ]
+
+@pytest.mark.sphinx(testroot='tabular', confoverrides={'repl_timing_report': True, 'repl_cache': False})
+def test_timing_report(app, status):
+    app.build()
+    assert 'slowest blocks' in status.getvalue()
+    with open(os.path.join(app.outdir, 'repl_timings.json')) as f:
+        timings = json.load(f)
+    assert timings['startup'] > 0
+    assert [block['docname'] for block in timings['blocks']] == ['index']
+
+@pytest.mark.sphinx(testroot='tabular', confoverrides={'repl_cache': False})
+def test_image_storage(app):
+    imgs_dir = os.path.join(app.outdir, '_images_repl')
+    os.makedirs(imgs_dir, exist_ok=True)
+    stale = os.path.join(imgs_dir, 'stale.svg')
+    open(stale, 'w').close()
+
+    app.build()
+
+    # images named by their content hash & unreferenced ones garbage-collected
+    images = sorted(os.listdir(imgs_dir))
+    assert len(images) == 3
+    assert images == sorted(app.env.repl_images['index'])
+    assert all(len(name.split('.')[0]) == 40 for name in images)
+
+@pytest.mark.sphinx(testroot='preamble')
+def test_preamble(app):
+    app.build()
+    for docname in ('index', 'other'):
+        doctree = app.env.get_doctree(docname)
+        block = next(doctree.findall(nodes.doctest_block))
+        assert block.astext().startswith('>>> ANSWER\n42')
+
+@pytest.mark.sphinx(testroot='sessions')
+def test_sessions(app):
+    app.build()
+
+    def texts(docname):
+        doctree = app.env.get_doctree(docname)
+        return [node.astext() for node in doctree.findall(nodes.doctest_block)]
+
+    assert texts('analysis') == ['>>> sum(data)\n6']
+    assert texts('index') == [
+        ">>> scratch = 'kept'",
+        ">>> 'scratch' in dir()\nFalse",
+        ">>> scratch\n'kept'",
+    ]
+
+@pytest.mark.parametrize('protocol', ['prompt', 'framed'])
+def test_output_budget(make_app, rootdir, tmp_path, protocol):
+    shutil.copytree(rootdir / 'test-output', tmp_path / 'src')
+    app = make_app(srcdir=path(str(tmp_path / 'src')), confoverrides={'repl_protocol': protocol})
+    app.build()
+    doctree = app.env.get_doctree('index')
+    texts = [node.astext() for node in doctree.findall(nodes.doctest_block)]
+    assert texts[0].splitlines() == [
+        '>>> for i in range(1000): print(i)',
+        '... ',
+        '0',
+        '1',
+        '2',
+        '[... output truncated ...]',
+    ]
+    lines = texts[1].splitlines()
+    assert len(texts[1]) < 2000
+    # budget used up for the rest of the block
+    assert lines[-2:] == ['[... output truncated ...]', ">>> 'not shown'"]